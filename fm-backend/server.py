@@ -1,185 +1,407 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
-import xml.etree.ElementTree as ET
-from pysat.formula import CNF
+from lxml import etree
+from array import array
+from collections import OrderedDict
 from pysat.solvers import Glucose3
-from itertools import combinations
+import orjson
+import re
+import sys
+import threading
+import time
+from uuid import uuid4
 
 app = Flask(__name__)
 CORS(app)
 
+GROUP_NONE, GROUP_XOR, GROUP_OR = 0, 1, 2
+GROUP_TYPES = {"XOR": GROUP_XOR, "OR": GROUP_OR}
+GROUP_NAMES = (None, "XOR", "OR")
+
+# Limits on MWP enumeration, which is exponential in the worst case
+MAX_MWPS = 10000
+MWP_TIME_BUDGET = 2.0
+MWP_CONFLICT_BUDGET = 100000
+
+# "<required feature> ... is required to ... <dependent feature>"
+REQUIRED_TO = re.compile(r"^(?P<required>.*?)\brequired to\b(?P<dependent>.*)$")
+
 class FeatureModel:
     def __init__(self):
-        self.features = {}
+        # Feature table, one row per feature in document order. Row idx is
+        # SAT variable idx + 1 and parent_idx is -1 for the root.
+        self.names = []
+        self.parent_idx = array("i")
+        self.mandatory = array("b")
+        self.group = array("b")
+        # Children of row idx are children_idx[children_offsets[idx]:children_offsets[idx + 1]]
+        self.children_offsets = array("i", [0])
+        self.children_idx = array("i")
         self.constraints = []
         self.var_map = {}
-        self.reverse_map = {}
+        # Variables are dense from 1, so var v is named reverse_names[v - 1]
+        self.reverse_names = []
         self.next_var = 1
         self.logic_rules = []
+        self._clauses = None
+        self._dirty = True
+        self._rules_built = False
+        self.solver = None
+        # PySAT solvers are not thread-safe; serialise solve calls per model
+        self.lock = threading.Lock()
+        self.independent_vars = set()
+        self.mandatory_pairs = []
+        self.xor_groups = []
+        self.or_groups = []
+        # (dependent var, required var) for each parsed "requires" constraint
+        self.requires_edges = []
 
     def get_var(self, name):
         if name not in self.var_map:
             self.var_map[name] = self.next_var
-            self.reverse_map[self.next_var] = name
+            self.reverse_names.append(name)
             self.next_var += 1
         return self.var_map[name]
 
-    def get_name(self, var):
-        return self.reverse_map.get(abs(var))
+    def children_of(self, idx):
+        return self.children_idx[self.children_offsets[idx]:self.children_offsets[idx + 1]]
+
+    def close(self):
+        # Release the native solver; a closed model can no longer validate
+        with self.lock:
+            if self.solver is not None:
+                self.solver.delete()
+                self.solver = None
+
+    def reset(self):
+        # Dispose the previous model's solver before loading a new one
+        self.close()
+        self.__init__()
 
     def parse_xml(self, xml_file):
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-
-        def parse_feature(element, parent=None):
-            name = element.attrib["name"]
-            feature = {
-                "name": name,
-                "mandatory": element.attrib.get("mandatory", "false").lower() == "true",
-                "parent": parent,
-                "children": [],
-                "group": None
-            }
-            
-            group = element.find("group")
-            if group is not None:
-                feature["group"] = group.attrib["type"].upper()
-                for child in group:
-                    child_feature = parse_feature(child, name)
-                    feature["children"].append(child_feature)
-            else:
-                for child in element.findall("feature"):
-                    child_feature = parse_feature(child, name)
-                    feature["children"].append(child_feature)
-            
-            self.features[name] = feature
-            return feature
-
-        root_feature = root.find("feature")
-        self.root = parse_feature(root_feature)
-
-        for constraint in root.findall(".//constraint"):
-            english = constraint.find("englishStatement")
-            if english is not None:
-                self.constraints.append({
-                    "englishStatement": english.text,
-                    "type": "requires" if "required to" in english.text else "excludes"
-                })
-
-    def generate_rules_and_cnf(self):
-        cnf = CNF()
-        self.logic_rules = []
+        self.reset()
+        # Tentative rows as (name, parent row, mandatory, inside parent's group)
+        rows = []
+        has_group = []
+        # Rows of the currently open <feature> elements; -1 marks features
+        # that are not modelled, along with their whole subtree
+        stack = []
+
+        for event, element in etree.iterparse(xml_file, events=("start", "end")):
+            tag = element.tag
+            if event == "start":
+                if tag == "feature":
+                    container = element.getparent()
+                    parent = stack[-1] if stack else -1
+                    in_group = False
+                    if not stack:
+                        # Only the first top-level tree is modelled
+                        member = not rows
+                    elif parent < 0:
+                        member = False
+                    elif container.tag == "group":
+                        # Only members of the parent's first <group> count
+                        in_group = True
+                        owner = container.getparent()
+                        member = owner.tag == "feature" and owner.find("group") is container
+                    else:
+                        # Direct children count only while the parent has no
+                        # group; earlier ones are dropped after parsing
+                        member = container.tag == "feature" and not has_group[parent]
+
+                    if not member:
+                        stack.append(-1)
+                        continue
+
+                    mandatory = element.get("mandatory", "false").lower() == "true"
+                    # Interned names hash once and compare by identity in set lookups
+                    rows.append((sys.intern(element.attrib["name"]), parent, mandatory, in_group))
+                    has_group.append(False)
+                    self.group.append(GROUP_NONE)
+                    stack.append(len(rows) - 1)
+
+                elif tag == "group" and stack and stack[-1] >= 0:
+                    owner = element.getparent()
+                    if owner.tag == "feature" and owner.find("group") is element:
+                        has_group[stack[-1]] = True
+                        self.group[stack[-1]] = GROUP_TYPES.get(element.attrib["type"].upper(),
+                                                                GROUP_NONE)
+
+            elif tag == "feature":
+                stack.pop()
+                element.clear()
+
+            elif tag == "constraint":
+                english = element.find("englishStatement")
+                if english is not None:
+                    self.constraints.append({
+                        "englishStatement": english.text,
+                        "type": "requires" if "required to" in english.text else "excludes"
+                    })
+
+        if not rows:
+            raise ValueError("No feature found in model")
+
+        # Drop direct children of grouped features, with their subtrees, and
+        # renumber the remaining rows. Parents precede children, so one pass works.
+        group = self.group
+        self.group = array("b")
+        new_idx = []
+        children = []
+        for idx, (name, parent, mandatory, in_group) in enumerate(rows):
+            if parent >= 0 and (new_idx[parent] < 0 or (has_group[parent] and not in_group)):
+                new_idx.append(-1)
+                continue
+            if name in self.var_map:
+                raise ValueError(f"Duplicate feature name: {name}")
+            row = len(self.names)
+            new_idx.append(row)
+            self.get_var(name)
+            self.names.append(name)
+            self.parent_idx.append(new_idx[parent] if parent >= 0 else -1)
+            self.mandatory.append(mandatory)
+            self.group.append(group[idx])
+            children.append([])
+            if parent >= 0:
+                children[new_idx[parent]].append(row)
+
+        for child_rows in children:
+            self.children_idx.extend(child_rows)
+            self.children_offsets.append(len(self.children_idx))
+
+        self.requires_edges = self.parse_requires_edges()
+
+        self._dirty = True
+        self.solver = Glucose3(bootstrap_with=self.get_clauses())
+
+        # Mandatory features follow their parent, so only the remaining
+        # variables need to appear in blocking clauses
+        num_features = len(self.names)
+        self.independent_vars = {
+            var for var in range(1, self.next_var)
+            if var > num_features or not self.mandatory[var - 1]
+        }
+
+        # Tree rules as direct lists, so checks iterate rules, not features
+        names = self.names
+        for idx, name in enumerate(names):
+            parent = self.parent_idx[idx]
+            if self.mandatory[idx] and parent >= 0:
+                self.mandatory_pairs.append((names[parent], name))
+            if self.group[idx] == GROUP_XOR:
+                self.xor_groups.append((name, [names[c] for c in self.children_of(idx)]))
+            elif self.group[idx] == GROUP_OR:
+                self.or_groups.append((name, [names[c] for c in self.children_of(idx)]))
+
+    def parse_requires_edges(self):
+        # Resolve "requires" statements to feature variables once. Each side of
+        # "required to" must name exactly one feature; anything else is left
+        # out of the CNF and flagged through the constraint's "encoded" key.
+        names = sorted(self.names, key=len, reverse=True)
+        mention = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b")
+
+        def only_feature(text):
+            found = set(mention.findall(text))
+            return found.pop() if len(found) == 1 else None
+
+        edges = []
+        for constraint in self.constraints:
+            constraint["encoded"] = False
+            if constraint["type"] != "requires":
+                continue
+            match = REQUIRED_TO.match(constraint["englishStatement"])
+            if not match:
+                continue
+            required = only_feature(match.group("required"))
+            dependent = only_feature(match.group("dependent"))
+            if required and dependent and required != dependent:
+                edges.append((self.var_map[dependent], self.var_map[required]))
+                constraint["encoded"] = True
+        return edges
+
+    def feature_tree(self):
+        nodes = [{
+            "name": name,
+            "mandatory": bool(self.mandatory[idx]),
+            "parent": self.names[self.parent_idx[idx]] if self.parent_idx[idx] >= 0 else None,
+            "children": [],
+            "group": GROUP_NAMES[self.group[idx]]
+        } for idx, name in enumerate(self.names)]
+
+        for idx, parent in enumerate(self.parent_idx):
+            if parent >= 0:
+                nodes[parent]["children"].append(nodes[idx])
+        return nodes[0]
+
+    def get_clauses(self, build_rules=True):
+        # Clauses and logic rules only change when a new model is parsed;
+        # rebuild as well if rules are wanted but were skipped last time
+        if self._dirty or self._clauses is None or (build_rules and not self._rules_built):
+            self._clauses = self.generate_rules(build_rules=build_rules)
+            self._rules_built = build_rules
+            self._dirty = False
+        return self._clauses
+
+    def generate_rules(self, build_rules=True):
+        # Rule strings are only needed for display; callers that just want
+        # clauses can skip the formatting and keep the current logic_rules
+        clauses = []
+        if build_rules:
+            self.logic_rules = []
 
         def add_rule(rule):
             self.logic_rules.append(rule)
 
-        def process_feature(feature):
-            name = feature["name"]
-            var = self.get_var(name)
+        # Rows are in document order, so a linear pass visits parents first
+        names = self.names
+        for idx, name in enumerate(names):
+            var = idx + 1
+            parent = self.parent_idx[idx]
 
             # Root
-            if not feature["parent"]:
-                cnf.append([var])
-                add_rule(name)
+            if parent < 0:
+                clauses.append([var])
+                if build_rules:
+                    add_rule(name)
 
             # Parent-child relationships
-            if feature["parent"]:
-                parent_var = self.get_var(feature["parent"])
-                if feature["mandatory"]:
-                    cnf.append([-parent_var, var])
-                    cnf.append([-var, parent_var])
-                    add_rule(f"{feature['parent']} → {name}")
-                    add_rule(f"{name} → {feature['parent']}")
+            else:
+                parent_var = parent + 1
+                parent_name = names[parent]
+                if self.mandatory[idx]:
+                    clauses.append([-parent_var, var])
+                    clauses.append([-var, parent_var])
+                    if build_rules:
+                        add_rule(f"{parent_name} → {name}")
+                        add_rule(f"{name} → {parent_name}")
                 else:
-                    cnf.append([-var, parent_var])
-                    add_rule(f"{name} → {feature['parent']}")
+                    clauses.append([-var, parent_var])
+                    if build_rules:
+                        add_rule(f"{name} → {parent_name}")
+
+            group = self.group[idx]
 
             # XOR groups
-            if feature["group"] == "XOR":
-                children = feature["children"]
-                child_vars = [self.get_var(c["name"]) for c in children]
-                child_names = [c["name"] for c in children]
+            if group == GROUP_XOR:
+                children = self.children_of(idx)
+                child_vars = [c + 1 for c in children]
+                child_names = [names[c] for c in children]
 
                 # Parent implies exactly one child
-                add_rule(f"{name} → ({' ∨ '.join(child_names)})")
-                cnf.append([-var] + child_vars)
+                if build_rules:
+                    add_rule(f"{name} → ({' ∨ '.join(child_names)})")
+                clauses.append([-var] + child_vars)
 
                 # Mutual exclusion
-                for c1, c2 in combinations(child_names, 2):
-                    add_rule(f"¬({c1} ∧ {c2})")
-                    cnf.append([-self.get_var(c1), -self.get_var(c2)])
+                count = len(child_vars)
+                for i in range(count):
+                    neg_i = -child_vars[i]
+                    for j in range(i + 1, count):
+                        if build_rules:
+                            add_rule(f"¬({child_names[i]} ∧ {child_names[j]})")
+                        clauses.append([neg_i, -child_vars[j]])
 
             # OR groups
-            elif feature["group"] == "OR":
-                children = feature["children"]
-                child_names = [c["name"] for c in children]
-                child_vars = [self.get_var(c["name"]) for c in children]
+            elif group == GROUP_OR:
+                children = self.children_of(idx)
+                child_names = [names[c] for c in children]
+                child_vars = [c + 1 for c in children]
 
                 # Parent implies at least one child
-                add_rule(f"{name} → ({' ∨ '.join(child_names)})")
-                cnf.append([-var] + child_vars)
-
-            for child in feature["children"]:
-                process_feature(child)
-
-        process_feature(self.root)
+                if build_rules:
+                    add_rule(f"{name} → ({' ∨ '.join(child_names)})")
+                clauses.append([-var] + child_vars)
 
         # Process constraints
-        for constraint in self.constraints:
-            if constraint["type"] == "requires":
-                if "filter" in constraint["englishStatement"]:
-                    add_rule("Location → ByLocation")
-                    cnf.append([-self.get_var("ByLocation"), self.get_var("Location")])
+        for dependent_var, required_var in self.requires_edges:
+            if build_rules:
+                add_rule(f"{names[dependent_var - 1]} → {names[required_var - 1]}")
+            clauses.append([-dependent_var, required_var])
 
-        return cnf
+        return clauses
 
     def find_mwps(self):
-        cnf = self.generate_rules_and_cnf()
-        solver = Glucose3()
-        for clause in cnf.clauses:
-            solver.add_clause(clause)
+        solver = Glucose3(bootstrap_with=self.get_clauses(build_rules=False))
+
+        def solve(assumptions=()):
+            # None means the conflict budget ran out before an answer
+            solver.conf_budget(MWP_CONFLICT_BUDGET)
+            return solver.solve_limited(assumptions=assumptions)
 
         mwps = []
-        while solver.solve():
+        truncated = False
+        top_id = self.next_var - 1
+        start = time.monotonic()
+        while True:
+            if time.monotonic() - start >= MWP_TIME_BUDGET:
+                truncated = True
+                break
+            found = solve()
+            if not found:
+                truncated = found is None
+                break
+            if len(mwps) >= MAX_MWPS:
+                truncated = True
+                break
+
             model = solver.get_model()
-            mwp = {self.get_name(var) for var in model if var > 0}
-            
-            # Ensure it contains all mandatory features
-            if self.is_valid_mwp(mwp):
-                mwps.append(mwp)
+            positive = [var for var in model if var > 0 and var in self.independent_vars]
+
+            # Shrink the model until no strict subset of it is satisfiable.
+            # The "at most |positive| - 1" constraint is guarded by a fresh
+            # selector so it can be retired once the model is minimal.
+            shrunk = False
+            while positive:
+                top_id += 1
+                selector = top_id
+                kept = set(positive)
+                solver.add_clause([-selector] + [-var for var in positive])
+                assumptions = [selector] + [-var for var in self.independent_vars
+                                            if var not in kept]
+                shrunk = solve(assumptions)
+                solver.add_clause([-selector])
+                if not shrunk:
+                    break
+                model = solver.get_model()
+                positive = [var for var in model if var > 0 and var in self.independent_vars]
+
+            if shrunk is None:
+                # Minimality of this model is unknown, so stop here
+                truncated = True
+                break
+
+            # MWPs are bitsets with bit var - 1 set for each selected feature
+            mask = 0
+            for var in model:
+                if 0 < var < self.next_var:
+                    mask |= 1 << (var - 1)
+            mwps.append(mask)
             
-            # Block this solution
-            solver.add_clause([-var for var in model if var > 0])
-
-        return self.filter_minimal_mwps(mwps)
-
-    def is_valid_mwp(self, mwp):
-        # Check mandatory features
-        for name, feature in self.features.items():
-            if feature["mandatory"] and feature["parent"] in mwp and name not in mwp:
-                return False
-        return True
-
-    def filter_minimal_mwps(self, mwps):
-        return [mwp for mwp in mwps 
-                if not any(other != mwp and other.issubset(mwp) for other in mwps)]
+            # Block this solution and its supersets
+            solver.add_clause([-var for var in positive])
+
+        solver.delete()
+        # Every model was shrunk to a minimal one and its supersets blocked,
+        # so the results already form an antichain
+        return {"mwps": mwps, "truncated": truncated}
+
+    def mwp_names(self, mask):
+        names = []
+        while mask:
+            low = mask & -mask
+            names.append(self.reverse_names[low.bit_length() - 1])
+            mask ^= low
+        return names
 
     def validate_selection(self, selected):
-        cnf = self.generate_rules_and_cnf()
-        solver = Glucose3()
-        
-        for clause in cnf.clauses:
-            solver.add_clause(clause)
-
-        # Add selection constraints
-        for name in self.features:
-            var = self.get_var(name)
-            if name in selected:
-                solver.add_clause([var])
-            else:
-                solver.add_clause([-var])
-
-        is_valid = solver.solve()
+        # Fix every feature through assumptions on the persistent solver
+        assumptions = [var if name in selected else -var
+                       for name, var in self.var_map.items()]
+
+        with self.lock:
+            if self.solver is None:
+                return None
+            is_valid = self.solver.solve(assumptions=assumptions)
         messages = []
 
         if not is_valid:
@@ -190,65 +412,98 @@ class FeatureModel:
     def get_violation_messages(self, selected):
         messages = []
         
-        def check_feature(feature):
-            name = feature["name"]
-            # Mandatory feature check
-            if feature["mandatory"] and feature["parent"] in selected and name not in selected:
+        # Mandatory feature check
+        for parent, name in self.mandatory_pairs:
+            if parent in selected and name not in selected:
                 messages.append(f"Missing mandatory feature: {name}")
 
-            # Group constraints
+        # Group constraints
+        for name, children in self.xor_groups:
             if name in selected:
-                if feature["group"] == "XOR":
-                    selected_children = [c["name"] for c in feature["children"] 
-                                      if c["name"] in selected]
-                    if len(selected_children) != 1:
-                        messages.append(f"XOR group {name} must have exactly one selection")
-                elif feature["group"] == "OR":
-                    selected_children = [c["name"] for c in feature["children"] 
-                                      if c["name"] in selected]
-                    if not selected_children:
-                        messages.append(f"OR group {name} must have at least one selection")
-
-            for child in feature["children"]:
-                check_feature(child)
-
-        check_feature(self.root)
+                selected_children = [c for c in children if c in selected]
+                if len(selected_children) != 1:
+                    messages.append(f"XOR group {name} must have exactly one selection")
+
+        for name, children in self.or_groups:
+            if name in selected and not any(c in selected for c in children):
+                messages.append(f"OR group {name} must have at least one selection")
 
         # Check cross-tree constraints
-        if "ByLocation" in selected and "Location" not in selected:
-            messages.append("Location feature is required for ByLocation")
+        names = self.names
+        for dependent_var, required_var in self.requires_edges:
+            dependent, required = names[dependent_var - 1], names[required_var - 1]
+            if dependent in selected and required not in selected:
+                messages.append(f"{required} feature is required for {dependent}")
 
         return messages
 
-model = FeatureModel()
+# Each upload gets its own model, looked up by the id returned to the client.
+# Models hold native solvers, so only the MAX_MODELS most recently used are
+# kept. The store is per process: under a multi-worker server a /validate
+# call only finds models uploaded to the same worker, so run one worker or
+# route clients to the worker that served their upload.
+MAX_MODELS = 32
+MODELS: OrderedDict[str, FeatureModel] = OrderedDict()
+MODELS_LOCK = threading.Lock()
+
+def store_model(model):
+    model_id = uuid4().hex
+    with MODELS_LOCK:
+        MODELS[model_id] = model
+        while len(MODELS) > MAX_MODELS:
+            _, evicted = MODELS.popitem(last=False)
+            evicted.close()
+    return model_id
+
+def lookup_model(model_id):
+    with MODELS_LOCK:
+        model = MODELS.get(model_id)
+        if model is not None:
+            MODELS.move_to_end(model_id)
+        return model
+
+def json_response(payload):
+    # orjson encodes the large upload payloads much faster than flask.jsonify
+    return app.response_class(orjson.dumps(payload), mimetype='application/json')
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
+        return json_response({"error": "No file uploaded"}), 400
     
     file = request.files['file']
     if not file.filename.endswith('.xml'):
-        return jsonify({"error": "Invalid file type"}), 400
+        return json_response({"error": "Invalid file type"}), 400
 
+    model = FeatureModel()
     try:
         model.parse_xml(file)
-        model.generate_rules_and_cnf()
-        mwps = model.find_mwps()
+        result = model.find_mwps()
+        model_id = store_model(model)
 
-        return jsonify({
-            "features": [model.root],
+        return json_response({
+            "modelId": model_id,
+            "features": [model.feature_tree()],
             "logicRules": model.logic_rules,
-            "mwps": [list(mwp) for mwp in mwps],
+            "mwps": [model.mwp_names(mwp) for mwp in result["mwps"]],
+            "truncated": result["truncated"],
             "constraints": model.constraints
         })
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        model.close()
+        return json_response({"error": str(e)}), 500
 
 @app.route('/validate', methods=['POST'])
 def validate():
-    selected = set(request.json.get('selectedFeatures', []))
-    return jsonify(model.validate_selection(selected))
+    model = lookup_model(request.json.get('modelId'))
+    selected = {sys.intern(name) for name in request.json.get('selectedFeatures', [])
+                if isinstance(name, str)}
+    # The model may also have been evicted between lookup and validation
+    result = model.validate_selection(selected) if model is not None else None
+    if result is None:
+        return json_response({"error": "Unknown model"}), 404
+
+    return json_response(result)
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,165 @@
+import io
+
+import server
+from server import FeatureModel
+
+SIMPLE_XML = """
+    <featureModel>
+      <feature name="A" mandatory="true">
+        <feature name="B"/>
+      </feature>
+    </featureModel>"""
+
+
+def load(xml):
+    model = FeatureModel()
+    model.parse_xml(io.BytesIO(xml.encode()))
+    return model
+
+
+def mwp_sets(model):
+    return {frozenset(model.mwp_names(mwp)) for mwp in model.find_mwps()["mwps"]}
+
+
+def test_only_group_members_belong_to_group():
+    model = load("""
+        <featureModel>
+          <feature name="A">
+            <feature name="X"/>
+            <group type="xor"><feature name="B"/><feature name="C"/></group>
+            <feature name="Y"/>
+          </feature>
+        </featureModel>""")
+
+    assert model.names == ["A", "B", "C"]
+    assert model.logic_rules == ["A", "A → (B ∨ C)", "¬(B ∧ C)", "B → A", "C → A"]
+    assert mwp_sets(model) == {frozenset({"A", "B"}), frozenset({"A", "C"})}
+
+
+def test_model_store_evicts_least_recently_used():
+    server.MODELS.clear()
+    models = [load(SIMPLE_XML) for _ in range(server.MAX_MODELS + 1)]
+    ids = [server.store_model(model) for model in models]
+
+    assert len(server.MODELS) == server.MAX_MODELS
+    assert server.lookup_model(ids[0]) is None
+    assert models[0].solver is None
+    assert models[0].validate_selection({"A"}) is None
+    assert server.lookup_model(ids[-1]) is models[-1]
+    server.MODELS.clear()
+
+
+def test_mwps_are_minimal():
+    model = load("""
+        <featureModel>
+          <feature name="A" mandatory="true">
+            <feature name="B">
+              <group type="or"><feature name="C"/><feature name="D"/></group>
+            </feature>
+            <feature name="E" mandatory="true">
+              <group type="xor"><feature name="F"/><feature name="G"/></group>
+            </feature>
+          </feature>
+        </featureModel>""")
+    mwps = mwp_sets(model)
+
+    assert mwps == {frozenset({"A", "E", "F"}), frozenset({"A", "E", "G"})}
+    assert not any(a < b for a in mwps for b in mwps)
+
+
+def test_truncated_only_when_mwps_remain(monkeypatch):
+    model = load(SIMPLE_XML.replace('<feature name="B"/>', """
+        <group type="xor"><feature name="B"/><feature name="C"/></group>"""))
+
+    monkeypatch.setattr(server, "MAX_MWPS", 2)
+    assert model.find_mwps()["truncated"] is False
+    monkeypatch.setattr(server, "MAX_MWPS", 1)
+    result = model.find_mwps()
+    assert result["truncated"] is True
+    assert len(result["mwps"]) == 1
+
+
+def test_validate_ignores_non_string_selections():
+    client = server.app.test_client()
+    upload = client.post("/upload", data={"file": (io.BytesIO(SIMPLE_XML.encode()), "m.xml")},
+                         content_type="multipart/form-data").get_json()
+
+    response = client.post("/validate", json={"modelId": upload["modelId"],
+                                              "selectedFeatures": ["A", 1]})
+    assert response.status_code == 200
+    assert response.get_json() == {"isValid": True, "messages": []}
+
+
+def test_mwps_include_mandatory_children():
+    model = load("""
+        <featureModel>
+          <feature name="A" mandatory="true">
+            <feature name="E" mandatory="true">
+              <group type="xor">
+                <feature name="B">
+                  <feature name="C" mandatory="true"/>
+                  <feature name="D"/>
+                </feature>
+                <feature name="F"/>
+              </group>
+            </feature>
+          </feature>
+        </featureModel>""")
+    mwps = mwp_sets(model)
+
+    assert frozenset({"A", "E", "B", "C"}) in mwps
+    for mwp in mwps:
+        assert all(parent not in mwp or child in mwp for parent, child in model.mandatory_pairs)
+
+
+SEARCH_XML = """
+    <featureModel>
+      <feature name="App" mandatory="true">
+        <feature name="Search" mandatory="true">
+          <group type="xor"><feature name="ByName"/><feature name="ByLocation"/></group>
+        </feature>
+        <feature name="Filter"/>
+        <feature name="Location"/>
+        <feature name="Payment"/>
+      </feature>
+      <constraints>
+        <constraint><englishStatement>{}</englishStatement></constraint>
+      </constraints>
+    </featureModel>"""
+
+
+def test_requires_statements():
+    cases = {
+        "Location is required to search ByLocation": ("ByLocation", "Location"),
+        "The Location feature is required to use ByLocation.": ("ByLocation", "Location"),
+        "Location is required to Filter ByLocation": None,
+        "Payment details are required to complete checkout": None,
+        "ByName excludes ByLocation": None,
+    }
+    for statement, edge in cases.items():
+        model = load(SEARCH_XML.format(statement))
+        edges = [(model.names[a - 1], model.names[b - 1]) for a, b in model.requires_edges]
+
+        assert edges == ([edge] if edge else []), statement
+        assert model.constraints[0]["encoded"] is (edge is not None), statement
+
+
+def test_requires_edge_constrains_validation():
+    model = load(SEARCH_XML.format("Location is required to search ByLocation"))
+
+    result = model.validate_selection({"App", "Search", "ByLocation"})
+    assert result == {"isValid": False,
+                      "messages": ["Location feature is required for ByLocation"]}
+    assert model.validate_selection({"App", "Search", "ByLocation", "Location"})["isValid"]
+
+
+def test_clause_cache_builds_rules_when_requested():
+    model = load(SIMPLE_XML)
+    rules = model.logic_rules
+
+    model._dirty = True
+    model.logic_rules = []
+    clauses = model.get_clauses(build_rules=False)
+    assert model.get_clauses(build_rules=False) is clauses
+    assert model.get_clauses() == clauses
+    assert model.logic_rules == rules
@@ -64,6 +64,7 @@ function FileUpload() {
     if (!selectedFeatures.size) return;
     try {
       const res = await axios.post("http://localhost:5000/validate", {
+        modelId: response?.modelId,
         selectedFeatures: Array.from(selectedFeatures)
       });
       setValidationResult(res.data);
@@ -223,12 +224,24 @@ function FileUpload() {
                     {response.logicRules?.join('\n') || 'No rules available'}
                   </SyntaxHighlighter>
                 </Box>
+                {response.constraints?.some(c => !c.encoded) && (
+                  <Alert severity="warning" sx={{ mt: 1 }}>
+                    Constraints not included in the rules:{' '}
+                    {response.constraints.filter(c => !c.encoded)
+                      .map(c => c.englishStatement).join('; ')}
+                  </Alert>
+                )}
               </CardContent>
             </Card>
 
             <Card>
               <CardContent>
                 <Typography variant="h6" gutterBottom>Minimum Working Products</Typography>
+                {response.truncated && (
+                  <Alert severity="warning" sx={{ mb: 1 }}>
+                    Enumeration limit reached; only the first MWPs are shown
+                  </Alert>
+                )}
                 <Box sx={{ maxHeight: 200, overflow: 'auto' }}>
                   <SyntaxHighlighter language="text" style={docco}>
                     {response.mwps?.map((mwp, i) => 